@@ -2,11 +2,11 @@ import pandas as pd
 import numpy as np
 import math
 import matplotlib.pyplot as plt
-from scipy import stats
 import streamlit as st
 from mplsoccer import PyPizza, add_image
 import matplotlib.image as mpimg
 import zipfile
+from gbe_data import MinutesRankIndex, player_keys, player_labels
 
 # =========================
 # LOAD DATA FOR PIZZA PLOT
@@ -34,10 +34,9 @@ def load_data():
     df = df.dropna(subset=["Position"]).reset_index(drop=True)
     df["Main Position"] = df["Position"].apply(lambda x: x.split()[0].rstrip(","))
 
-    # Only CF / Wingers with minutes threshold
+    # Only CF / Wingers (minutes threshold is applied in the app)
     positions = ["CF", "LWF", "RWF", "RW", "LW"]
     df = df[df["Main Position"].isin(positions)]
-    df = df[df["Minutes played"] >= 800]
 
     # Custom metrics
     df["Progressive passes"] = df["Accurate progressive passes, %"] / 100 * df["Progressive passes per 90"]
@@ -56,11 +55,16 @@ def load_data():
     df["Non-Pen xG per 50 Received Passes"] = df["Non-penalty xG"] / df["50 Received Passes"]
     df["Non-Pen xG per Received Pass"] = df["Non-penalty xG"] / df["Received Passes"]
 
+    # Stable player keys (abbreviated names are not unique) and dropdown labels
+    df.index = player_keys(df)
+    labels = player_labels(df)
+
     df = df[
         [
             "Player",
             "League",
             "Main Position",
+            "Minutes played",
             "Non-penalty xG",
             "Non-penalty goals per 90",
             "Non-Pen xG per Received Pass",
@@ -84,6 +88,7 @@ def load_data():
         "Player",
         "League",
         "Main Position",
+        "Minutes played",
         "Non-penalty xG",
         "Non-penalty goals\nper 90",
         "Non-Pen xG per\nReceived Pass",
@@ -102,7 +107,15 @@ def load_data():
         "Aerial duels\nwon, %",
     ]
 
-    return df
+    return df, labels
+
+
+# Percentile index per league, answers any minutes threshold
+@st.cache_resource
+def minutes_index(league):
+    df, _ = load_data()
+    df_league = df[df["League"] == league]
+    return MinutesRankIndex(df_league["Minutes played"], df_league[df_league.columns[4:]])
 
 
 # =========================
@@ -182,18 +195,30 @@ with tab1:
 with tab2:
     st.header("Interactive Player Pizza Plot")
 
-    df = load_data()
+    df, labels = load_data()
 
     league_filter = st.selectbox("Select League", sorted(df["League"].unique()))
     df_league = df[df["League"] == league_filter]
-    player_name = st.selectbox("Select a Player", sorted(df_league["Player"].unique()))
+    min_minutes = st.slider(
+        "Minimum minutes played", min_value=0, max_value=int(df_league["Minutes played"].max()), value=800, step=50
+    )
+    df_league = df_league[df_league["Minutes played"] >= min_minutes]
+    ranks = minutes_index(league_filter)
+    player_key = st.selectbox(
+        "Select a Player", labels[df_league.index].sort_values().index, format_func=lambda key: labels[key]
+    )
+
+    params = list(df_league.columns)[4:]
+    if player_key is None:
+        st.info("No players meet the current minutes threshold.")
+        st.stop()
 
-    params = list(df_league.columns)[3:]
-    player_row = df_league.loc[df_league["Player"] == player_name].iloc[0]
-    player_values = player_row[3:].astype(float).values
+    player_row = df.loc[player_key]
+    player_name = player_row["Player"]
+    player_values = player_row[4:].astype(float).values
 
     values = [
-        math.floor(stats.percentileofscore(df_league[param].astype(float), player_values[i]))
+        math.floor(ranks.percentile(param, player_values[i], min_minutes))
         for i, param in enumerate(params)
     ]
 
@@ -2,10 +2,10 @@ import pandas as pd
 import numpy as np
 import math
 import matplotlib.pyplot as plt
-from scipy import stats
 from mplsoccer import PyPizza, add_image
 import streamlit as st
 from PIL import Image
+from gbe_data import MinutesRankIndex, player_keys, player_labels
 
 # =========================
 # LOAD DATA
@@ -28,7 +28,6 @@ def load_data():
     df['Main Position'] = df['Position'].apply(lambda x: x.split()[0].rstrip(','))
     positions = ['CF', 'LWF', 'RWF', 'RW', 'LW']
     df = df[df['Main Position'].isin(positions)]
-    df = df[df["Minutes played"] >= 200]
 
     # Custom metrics
     df['Progressive passes'] = df['Accurate progressive passes, %'] /100 * df['Progressive passes per 90']
@@ -47,6 +46,10 @@ def load_data():
     df['Non-Pen xG per 50 Received Passes'] = df['Non-penalty xG'] / df['50 Received Passes']
     df['Non-Pen xG per Received Pass'] = df['Non-penalty xG'] / df['Received Passes']
 
+    # Stable player keys (abbreviated names are not unique) and dropdown labels
+    df.index = player_keys(df)
+    labels = player_labels(df)
+
     df = df[['Player','League','Main Position','Minutes played',
              'Non-penalty xG', 'Non-penalty goals per 90', 
              'Non-Pen xG per Received Pass', 'Shots per 90', 'Shots on target, %', 
@@ -65,9 +68,16 @@ def load_data():
                   'Defensive duels\nper 90','Defensive duels\nwon, %',  
                   'Aerial duels\nper 90', 'Aerial duels\nwon, %']
 
-    return df
+    return df, labels
+
+# Percentile index per league/position pool, answers any minutes threshold
+@st.cache_resource
+def minutes_index(league, position):
+    df, _ = load_data()
+    pool = df[(df['League'] == league) & (df['Main Position'] == position)]
+    return MinutesRankIndex(pool['Minutes played'], pool[pool.columns[4:]])
 
-df = load_data()
+df, labels = load_data()
 
 # =========================
 # STREAMLIT APP
@@ -89,18 +99,31 @@ position_filter = st.sidebar.selectbox("Select Position", sorted(df_league['Main
 # Filter df by position
 df_filtered = df_league[df_league['Main Position'] == position_filter]
 
+# Minutes threshold
+min_minutes = st.sidebar.slider("Minimum minutes played", min_value=0,
+                                max_value=int(df_filtered['Minutes played'].max()),
+                                value=200, step=50)
+df_filtered = df_filtered[df_filtered['Minutes played'] >= min_minutes]
+ranks = minutes_index(league_filter, position_filter)
+
 # Player dropdown
-player_name = st.sidebar.selectbox("Select a Player", sorted(df_filtered['Player'].unique()))
+player_key = st.sidebar.selectbox("Select a Player", labels[df_filtered.index].sort_values().index,
+                                  format_func=lambda key: labels[key])
 
 # Extract player values
 params = list(df_filtered.columns)[4:]  # skip Player, League, Main Position, Minutes played
-player_row = df_filtered.loc[df_filtered['Player'] == player_name].iloc[0]
+if player_key is None:
+    st.info("No players meet the current minutes threshold.")
+    st.stop()
+
+player_row = df.loc[player_key]
+player_name = player_row['Player']
 player_values = player_row[4:].astype(float).values
 minutes_played = int(player_row["Minutes played"])
 
 # Percentile values
 values = [
-    math.floor(stats.percentileofscore(df_filtered[param].astype(float), player_values[i]))
+    math.floor(ranks.percentile(param, player_values[i], min_minutes))
     for i, param in enumerate(params)
 ]
 
@@ -1,18 +1,77 @@
 import pandas as pd
 import numpy as np
 import math
-import matplotlib.pyplot as plt
-from scipy import stats
+import tempfile
+import uuid
 import streamlit as st
-from mplsoccer import PyPizza, add_image
-import matplotlib.image as mpimg
+from gbe_data import MinutesRankIndex, RollupStore, WorkbookLoader, player_keys, player_labels
+from gbe_pizza import PizzaPrefetcher
+from gbe_report import write_pdf_report
 
 # =========================
 # LOAD DATA
 # =========================
-@st.cache_data
-def load_excel(file_path):
-    return pd.read_excel(file_path, sheet_name=None)
+# Frames below are cached as shared resources (no per-rerun copy).
+# Treat them as read-only: filter into new frames, never assign into them.
+@st.cache_resource
+def load_workbook(file_path):
+    """Band workbook; sheets are parsed on first use, several at once in worker processes."""
+    return WorkbookLoader(file_path)
+
+def load_bands(file_path):
+    """{band name: sheet name}, with sheets renamed to Band 1-6."""
+    band_names = {f"Sheet{i}": f"Band {i}" for i in range(1, 7)}
+    return {band_names.get(name, name): name for name in load_workbook(file_path).sheet_names}
+
+@st.cache_resource
+def rollup_store(file_path):
+    """Team/league/position rollups; kept across workbook reloads so unchanged bands are not rebuilt."""
+    return RollupStore(ROLES)
+
+@st.cache_resource
+def enriched_band(file_path, band):
+    """Band sheet with custom metrics, indexed by stable player key (O(1) df.loc[key])."""
+    sheet_name = load_bands(file_path)[band]
+    df = add_custom_metrics(load_workbook(file_path).get([sheet_name])[sheet_name].copy())
+    df.index = player_keys(df)
+    df["Player label"] = player_labels(df)
+    rollup_store(file_path).update(band, df)
+    return df
+
+def enriched_bands(file_path, bands):
+    """enriched_band for several bands, parsing the missing sheets in one concurrent batch."""
+    sheet_names = load_bands(file_path)
+    load_workbook(file_path).get([sheet_names[band] for band in bands])
+    return [enriched_band(file_path, band) for band in bands]
+
+@st.cache_resource(max_entries=16)
+def combined_bands(file_path, bands):
+    """Selected bands' enriched data stacked with a Band column (bands is a tuple)."""
+    return pd.concat(enriched_bands(file_path, bands), keys=list(bands), names=['Band', 'Player key']).reset_index()
+
+def reload_if_changed(file_path):
+    """Drop cached band data when the workbook changes on disk (rollups update per band)."""
+    if load_workbook(file_path).refresh():
+        enriched_band.clear()
+        combined_bands.clear()
+        minutes_index.clear()
+        pizza_prefetcher().clear()
+
+def minutes_played(df):
+    """Minutes played with missing values as 0, as MinutesRankIndex counts them."""
+    return pd.to_numeric(df["Minutes played"], errors="coerce").fillna(0)
+
+@st.cache_resource(max_entries=64)
+def minutes_index(file_path, band, group):
+    """Minutes-threshold percentile index over a band's position group."""
+    df = enriched_band(file_path, band)
+    df_group = df[df["Main Position"].isin(POSITION_GROUPS[group])]
+    return MinutesRankIndex(minutes_played(df_group), df_group[METRICS[group][1:]])
+
+@st.cache_resource
+def pizza_prefetcher():
+    """Rendered pizza PNGs shared by all sessions, plus background rendering of likely next picks."""
+    return PizzaPrefetcher()
 
 # =========================
 # ADD CUSTOM METRICS
@@ -119,6 +178,14 @@ METRICS = {
     ]
 }
 
+ROLES = [
+    "Complete CB", "Ball Playing CB", "Full Back (attacking)", "Full Back (defensive)",
+    "Stopper", "Wide Central Defender", "Front-foot Agressive Ball Winner",
+    "Deep-Lying Playmaker", "Runner", "Progressive Recycler", "Defensive Screen",
+    "Defensive Winger", "Dribbling Winger", "Inside Forward", "Wide Direct Goalscorer",
+    "False 9", "Pressing Forward", "Target Man", "Power Forward", "Pure Goalscorer"
+]
+
 # Custom metric names with line breaks to prevent overlap
 CUSTOM_METRIC_NAMES = {
     'Non-penalty xG': 'Non-penalty\nxG',
@@ -150,27 +217,137 @@ CUSTOM_METRIC_NAMES = {
     'Succ Passes to pen area per 90': 'Succ Passes to\npen area per 90'
 }
 
+# =========================
+# PIZZA SPECS
+# =========================
+def group_of(main_position):
+    """Position group a Main Position belongs to, or None."""
+    for group, group_positions in POSITION_GROUPS.items():
+        if main_position in group_positions:
+            return group
+    return None
+
+def pizza_spec(player_row, ranks, min_minutes, selected_group, band):
+    """Everything needed to draw a player's pizza, as a picklable dict (see gbe_pizza).
+
+    Percentiles come from ranks (a MinutesRankIndex over the position group) and are
+    taken against peers with at least min_minutes minutes played.
+    """
+    params = METRICS[selected_group][1:]
+    player_values = player_row[params].astype(float).values
+
+    # Percentiles (missing values shown as 0)
+    percentiles = [ranks.percentile(param, player_values[i], min_minutes) for i, param in enumerate(params)]
+    values = [0 if np.isnan(p) else math.floor(p) for p in percentiles]
+    peers = f"{selected_group}, {min_minutes}+ mins" if min_minutes else selected_group
+
+    team = player_row['Team'] if 'Team' in player_row else "Unknown Team"
+    league = player_row['League'] if 'League' in player_row else "Unknown League"
+    info_texts = [f"Position: {player_row['Main Position']}", f"Minutes played: {player_row['Minutes played']}"]
+    if 'Contract expires' in player_row:
+        info_texts.append(f"Contract expires: {player_row['Contract expires']}")
+
+    return {
+        "player": f"{player_row['Player']}",
+        "subtitle": f"{team} - {league} | Percentile Rank vs {band} peers ({peers})",
+        "group": selected_group,
+        # Apply custom names to params for display
+        "params": [CUSTOM_METRIC_NAMES.get(param, param) for param in params],
+        "values": values,
+        "info": info_texts,
+    }
+
+def prefetch_pizzas(file_path, band, df, selected_group, min_minutes, player_options, player_key, context):
+    """Queue background renders of the pizzas this session is likely to open next.
+
+    That is the next few players in the dropdown, and for each other position group the
+    player its dropdown opens on (groups don't overlap, so that is what switching group shows).
+    """
+    n_next = 3
+    targets = []
+    position = player_options.index(player_key)
+    targets += [(key, selected_group) for key in player_options[position + 1:position + 1 + n_next]]
+    for group in POSITION_GROUPS:
+        if group == selected_group:
+            continue
+        df_other = df[df["Main Position"].isin(POSITION_GROUPS[group]) & (minutes_played(df) >= min_minutes)]
+        if not df_other.empty:
+            targets.append((df_other["Player label"].idxmin(), group))
+
+    jobs = {}
+    for key, group in targets:
+        # Resolve cached inputs here; the spec itself (percentiles) is built in the worker
+        ranks = minutes_index(file_path, band, group)
+        jobs[(file_path, band, group, min_minutes, key)] = (
+            lambda key=key, group=group, ranks=ranks: pizza_spec(df.loc[key], ranks, min_minutes, group, band))
+
+    session_id = st.session_state.setdefault("tab2_prefetch_session", uuid.uuid4().hex)
+    pizza_prefetcher().prefetch(session_id, context, jobs)
+
+def report_specs(file_path, band, player_rows, min_minutes):
+    """Lazily yield report-page specs for the given rows of an enriched band frame.
+
+    Each player is ranked against their own position group in the band; players whose
+    Main Position is in no group are skipped.
+    """
+    for _, player_row in player_rows.iterrows():
+        group = group_of(player_row["Main Position"])
+        if group is None:
+            continue
+        spec = pizza_spec(player_row, minutes_index(file_path, band, group), min_minutes, group, band)
+        spec["roles"] = [(role, float(player_row[role])) for role in ROLES
+                         if role in player_row and pd.notna(player_row[role])]
+        yield spec
+
+# =========================
+# PAGINATION
+# =========================
+PAGE_SIZES = [25, 50, 100]
+
+def paginate(row_order, key, view):
+    """Draw page controls and return the slice of row_order on the current page.
+
+    view is any hashable description of what is being listed (role, filters, ...);
+    when it changes the table goes back to page 1.
+    """
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    n_pages = max(1, math.ceil(len(row_order) / page_size))
+
+    # Page number lives in session state so it survives reruns; start over on a new view
+    # and clamp it when a smaller page count comes from a larger page size
+    page_key, view_key = f"{key}_page", f"{key}_view"
+    if st.session_state.get(view_key) != view:
+        st.session_state[view_key] = view
+        st.session_state[page_key] = 1
+    elif st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+    page = st.number_input("Page", min_value=1, max_value=n_pages, step=1, key=page_key)
+
+    start = (page - 1) * page_size
+    end = min(start + page_size, len(row_order))
+    st.caption(f"Showing {start + 1 if end else 0}-{end} of {len(row_order)} players (page {page} of {n_pages})")
+    return row_order[start:end]
+
 # =========================
 # STREAMLIT APP
 # =========================
-st.title("⚽ GBE Expert Hub Dashboard")
-tab1, tab2 = st.tabs(["📊 Player Ratings", "Radar Plot"])
+# Each tab is a fragment: a widget change reruns only the tab it lives in,
+# and both tabs read their data through the cached loaders above.
 
 # ========== TAB 1 ==========
-with tab1:
+@st.fragment
+def ratings_tab(file_path):
     st.header("Player Ratings by Band & Role")
-    file_path = "combined_band_sheets.xlsx"
-    sheets_dict = load_excel(file_path)
-    # Rename sheets to Band 1-6
-    band_names = {f"Sheet{i}": f"Band {i}" for i in range(1, 7)}
-    sheets_dict = {band_names.get(name, name): df for name, df in sheets_dict.items()}
+    bands = list(load_bands(file_path).keys())
 
     # Multi-select for bands
-    sheet_names = st.multiselect("Select Bands", list(sheets_dict.keys()), default=list(sheets_dict.keys())[:1])
-    
+    sheet_names = st.multiselect("Select Bands", bands, default=bands[:1], key="tab1_bands")
+    if not sheet_names:
+        st.info("Select at least one band.")
+        return
+
     # Combine selected bands' data for display
-    df_combined = pd.concat([add_custom_metrics(sheets_dict[sheet_name].copy()) for sheet_name in sheet_names], 
-                           keys=sheet_names, names=['Band', 'Index']).reset_index()
+    df_combined = combined_bands(file_path, tuple(sheet_names))
 
     # Team dropdown (does not affect calculations)
     if "Team" in df_combined.columns:
@@ -179,31 +356,33 @@ with tab1:
         if selected_team != "All":
             df_filtered = df_combined[df_combined["Team"].astype(str) == selected_team]
         else:
-            df_filtered = df_combined.copy()
+            df_filtered = df_combined
     else:
-        df_filtered = df_combined.copy()
+        selected_team = "All"
+        df_filtered = df_combined
 
     # Player search bar
     search_query = st.text_input("Search Player", "", key="tab1_search")
     if search_query:
         df_filtered = df_filtered[df_filtered["Player"].astype(str).str.contains(search_query, case=False, na=False)]
 
-    role_choice = st.selectbox("Select Role", [
-        "Complete CB", "Ball Playing CB", "Full Back (attacking)", "Full Back (defensive)", 
-        "Stopper", "Wide Central Defender", "Front-foot Agressive Ball Winner", 
-        "Deep-Lying Playmaker", "Runner", "Progressive Recycler", "Defensive Screen", 
-        "Defensive Winger", "Dribbling Winger", "Inside Forward", "Wide Direct Goalscorer", 
-        "False 9", "Pressing Forward", "Target Man", "Power Forward", "Pure Goalscorer"
-    ], key="tab1_role")
+    role_choice = st.selectbox("Select Role", ROLES, key="tab1_role")
+    # Stop before the age and position filters: drawn with no options they would keep
+    # an empty selection that hides every player in later searches
+    if df_filtered.empty:
+        st.info("No players match this search.")
+        return
 
     # Age filter
-    if "Age" in df_filtered.columns:
+    age_range = None
+    if "Age" in df_filtered.columns and df_filtered["Age"].notna().any():
         min_age = int(df_filtered["Age"].min())
         max_age = int(df_filtered["Age"].max())
         age_range = st.slider("Filter by Age", min_value=min_age, max_value=max_age, value=(min_age, max_age), key="tab1_age")
         df_filtered = df_filtered[(df_filtered["Age"] >= age_range[0]) & (df_filtered["Age"] <= age_range[1])]
 
     # Position filter
+    selected_positions = None
     if "Main Position" in df_filtered.columns:
         positions = df_filtered["Main Position"].dropna().unique().tolist()
         selected_positions = st.multiselect("Filter by Main Position", options=positions, default=positions, key="tab1_position")
@@ -211,26 +390,37 @@ with tab1:
 
     # Top N filter
     top_n_choice = st.radio("Show Top:", options=["All", "Top 5", "Top 10"], index=0, horizontal=True, key="tab1_topn")
-    df_filtered = df_filtered.sort_values(by=role_choice, ascending=False)
+    # Sort only the role column; rows are materialized per page below
+    row_order = df_filtered[role_choice].sort_values(ascending=False).index
     if top_n_choice == "Top 5":
-        df_filtered = df_filtered.head(5)
+        row_order = row_order[:5]
     elif top_n_choice == "Top 10":
-        df_filtered = df_filtered.head(10)
+        row_order = row_order[:10]
 
     columns_to_show = ["Band", "Player", "League", "Position", "Age", "Team", "Minutes played", role_choice]
-    st.dataframe(df_filtered[columns_to_show])
+    view = (tuple(sheet_names), selected_team, search_query, role_choice, age_range,
+            tuple(selected_positions or ()), top_n_choice)
+    page_rows = paginate(row_order, key="tab1", view=view)
+    st.dataframe(df_filtered.loc[page_rows, columns_to_show])
 
 # ========== TAB 2 ==========
-with tab2:
+@st.fragment
+def pizza_tab(file_path):
     st.header("Interactive Player Pizza Plot")
-    sheet_name = st.selectbox("Select Band for Pizza Plot", list(sheets_dict.keys()), key="tab2_band")
-    df = add_custom_metrics(sheets_dict[sheet_name].copy())
+    sheet_name = st.selectbox("Select Band for Pizza Plot", list(load_bands(file_path).keys()), key="tab2_band")
+    df = enriched_band(file_path, sheet_name)
 
     # Position group
     selected_group = st.selectbox("Select Position Group", list(POSITION_GROUPS.keys()), key="tab2_group")
     group_positions = POSITION_GROUPS[selected_group]
     df_group = df[df["Main Position"].isin(group_positions)]  # Full group for percentiles
 
+    # Minutes threshold: percentiles are against peers above it, served from the cached index
+    max_minutes = int(minutes_played(df_group).max()) if not df_group.empty else 0
+    min_minutes = st.slider("Minimum minutes played", min_value=0, max_value=max(max_minutes, 1), value=0, step=50, key="tab2_minutes")
+    ranks = minutes_index(file_path, sheet_name, selected_group)
+    df_group = df_group[minutes_played(df_group) >= min_minutes]
+
     # Team filter for dropdown only
     if "Team" in df_group.columns:
         teams = sorted(df_group['Team'].dropna().astype(str).unique())
@@ -238,110 +428,96 @@ with tab2:
         if selected_team != "All":
             df_filtered = df_group[df_group["Team"].astype(str) == selected_team]
         else:
-            df_filtered = df_group.copy()
+            df_filtered = df_group
     else:
-        df_filtered = df_group.copy()
+        selected_team = "All"
+        df_filtered = df_group
 
     # Player search bar
     search_query = st.text_input("Search Player", "", key="tab2_search")
     if search_query:
         df_filtered = df_filtered[df_filtered["Player"].astype(str).str.contains(search_query, case=False, na=False)]
 
-    # Player selection
-    player_name = st.selectbox("Select a Player", sorted(df_filtered['Player'].astype(str).unique()), key="tab2_player")
-
-    # Metrics and params
-    metrics = METRICS[selected_group]
-    params = metrics[1:]
-    # Apply custom names to params for display
-    display_params = [CUSTOM_METRIC_NAMES.get(param, param) for param in params]
-
-    player_row = df_group.loc[df_group['Player'] == player_name].iloc[0]
-    player_values = player_row[params].astype(float).values
-
-    # Percentiles
-    values = [math.floor(stats.percentileofscore(df_group[param].astype(float), player_values[i])) for i, param in enumerate(params)]
-
-    # Slice and text colors based on group
-    if selected_group == "Forwards":
-        slice_colors = ["#44aa66"] * 6 + ["#f4c430"] * 6 + ["#367588"] * 4
-        text_colors = ["#000000"] * 16
-    elif selected_group == "CMs":
-        slice_colors = ["#44aa66"] * 3 + ["#f4c430"] * 8 + ["#367588"] * 5
-        text_colors = ["#000000"] * 16
-    elif selected_group == "FBs/WBs":
-        slice_colors = ["#44aa66"] * 7 + ["#f4c430"] * 5 + ["#367588"] * 5
-        text_colors = ["#000000"] * 17
-    elif selected_group == "CBs":
-        slice_colors = ["#44aa66"] * 3 + ["#f4c430"] * 8 + ["#367588"] * 6
-        text_colors = ["#000000"] * 17
-    elif selected_group == "Wingers/AMs":
-        slice_colors = ["#44aa66"] * 6 + ["#f4c430"] * 6 + ["#367588"] * 4
-        text_colors = ["#000000"] * 16
-    else:
-        slice_colors = ["#44aa66"] * len(params)
-        text_colors = ["#000000"] * len(params)
-
-    # Pizza chart
-    baker = PyPizza(
-        params=display_params,
-        background_color="#0A2D57",
-        straight_line_color="#FFFFFF",
-        straight_line_lw=1,
-        last_circle_lw=0,
-        other_circle_lw=0,
-        inner_circle_size=5
-    )
-
-    fig, ax = baker.make_pizza(
-        values,
-        figsize=(10, 10),
-        color_blank_space="same",
-        slice_colors=slice_colors,
-        value_colors=text_colors,
-        value_bck_colors=slice_colors,
-        blank_alpha=0.4,
-        kwargs_slices=dict(edgecolor="#FFFFFF", zorder=2, linewidth=1),
-        kwargs_params=dict(color="#FFFFFF", fontsize=11),
-        kwargs_values=dict(color="#FFFFFF", fontsize=12,
-                           bbox=dict(edgecolor="#FFFFFF", facecolor="#0A2D57", boxstyle="round,pad=0.2", lw=1))
-    )
-
-    # Titles
-    fig.text(0.515, 0.9975, f"{player_name}", size=18, fontweight='bold', ha="center", color="#FFFFFF")
-    team = player_row['Team'] if 'Team' in player_row else "Unknown Team"
-    league = player_row['League'] if 'League' in player_row else "Unknown League"
-    fig.text(0.515, 0.975, f"{team} - {league} | Percentile Rank vs {sheet_name} peers ({selected_group})", size=14, ha="center", color="#FFFFFF")
-
-    # Top-left info
-    info_texts = [f"Position: {player_row['Main Position']}", f"Minutes played: {player_row['Minutes played']}"]
-    if 'Contract expires' in player_row:
-        info_texts.append(f"Contract expires: {player_row['Contract expires']}")
-    for i, txt in enumerate(info_texts):
-        fig.text(0.02, 0.92 - i*0.025, txt, ha="left", color="#FFFFFF", fontsize=12)
-
-    # Legend
-    fig.text(0.35, 0.945, "Attacking     Possession     Defending", size=14, color="#FFFFFF")
-    fig.patches.extend([
-        plt.Rectangle((0.32, 0.9425), 0.025, 0.021, fill=True, color="#44aa66", transform=fig.transFigure, figure=fig),
-        plt.Rectangle((0.445, 0.9425), 0.025, 0.021, fill=True, color="#f4c430", transform=fig.transFigure, figure=fig),
-        plt.Rectangle((0.582, 0.9425), 0.025, 0.021, fill=True, color="#367588", transform=fig.transFigure, figure=fig),
-    ])
-
-    # Logo
-    try:
-        logo = mpimg.imread("Capture.png")
-        add_image(logo, fig, left=0.82, bottom=0.02, width=0.15, height=0.08)
-    except:
-        pass
-
-    st.pyplot(fig, use_container_width=False, width=80)
-
-
-
-
-
-
+    # Player selection (options are player keys, shown by name)
+    player_options = df_filtered.sort_values("Player label").index.tolist()
+    player_key = st.selectbox("Select a Player", player_options,
+                              format_func=lambda key: df.at[key, "Player label"], key="tab2_player")
+    if player_key is None:
+        st.info("No players match the current filters.")
+        return
+
+    player_row = df.loc[player_key]
+    png = pizza_prefetcher().render((file_path, sheet_name, selected_group, min_minutes, player_key),
+                                    lambda: pizza_spec(player_row, ranks, min_minutes, selected_group, sheet_name))
+    st.image(png)
+    prefetch_pizzas(file_path, sheet_name, df, selected_group, min_minutes, player_options, player_key,
+                    context=(file_path, sheet_name, min_minutes, selected_team, search_query))
+
+    # Scouting report
+    with st.expander("📄 Scouting report (PDF)"):
+        report_scope = st.radio("Report on", ["Team", "Shortlist"], horizontal=True, key="tab2_report_scope")
+        if report_scope == "Team":
+            if selected_team == "All":
+                st.info("Pick a team in 'Filter by Team' above to report on its players.")
+                report_rows = df.iloc[0:0]
+            else:
+                report_rows = df[df["Team"].astype(str) == selected_team]
+            report_rows = report_rows.sort_values("Player")
+        else:
+            shortlist = st.multiselect("Shortlist", df.sort_values("Player label").index,
+                                       format_func=lambda key: df.at[key, "Player label"], key="tab2_shortlist")
+            report_rows = df.loc[shortlist]
+        report_rows = report_rows[minutes_played(report_rows) >= min_minutes]
+        # Only players in a position group get a page (see report_specs)
+        report_rows = report_rows[report_rows["Main Position"].map(group_of).notna()]
+
+        if st.button(f"Build report ({len(report_rows)} players)", disabled=report_rows.empty, key="tab2_report_build"):
+            progress = st.progress(0.0)
+            with tempfile.TemporaryFile() as report_file:
+                n_pages = write_pdf_report(
+                    report_specs(file_path, sheet_name, report_rows, min_minutes), report_file,
+                    on_page=lambda n: progress.progress(n / len(report_rows)),
+                )
+                report_file.seek(0)
+                # Pages stream to a temporary file, but the download button needs the whole PDF in memory
+                st.caption("The finished PDF is loaded into memory for the download, so very long reports are best split up.")
+                st.download_button(f"Download report ({n_pages} pages)", report_file.read(), file_name="scouting_report.pdf",
+                                   mime="application/pdf", on_click="ignore", key="tab2_report_download")
+
+# ========== TAB 3 ==========
+@st.fragment
+def team_overview_tab(file_path):
+    st.header("Team & League Overview")
+    bands = list(load_bands(file_path).keys())
+    selected_bands = st.multiselect("Select Bands", bands, default=bands[:1], key="tab3_bands")
+    if not selected_bands:
+        st.info("Select at least one band.")
+        return
+    # Loading a band materializes its rollups; after that everything below reads the rollup tables
+    enriched_bands(file_path, selected_bands)
+    store = rollup_store(file_path)
+
+    group_by = st.radio("Group by", ["Team", "League", "Main Position"], horizontal=True, key="tab3_group_by")
+    role_choice = st.selectbox("Select Role", ROLES, key="tab3_role")
+
+    summary = store.summary(group_by, role_choice, selected_bands)
+    st.subheader(f"{role_choice} ratings by {group_by}")
+    st.dataframe(summary)
+
+    st.subheader(f"Players per band by {group_by}")
+    st.dataframe(store.band_counts(group_by, selected_bands))
+
+# ========== LAYOUT ==========
+st.title("⚽ GBE Expert Hub Dashboard")
+tab1, tab2, tab3 = st.tabs(["📊 Player Ratings", "Radar Plot", "🏟️ Team Overview"])
+file_path = "combined_band_sheets.xlsx"
+reload_if_changed(file_path)
 
+with tab1:
+    ratings_tab(file_path)
 
+with tab2:
+    pizza_tab(file_path)
 
+with tab3:
+    team_overview_tab(file_path)
@@ -0,0 +1,311 @@
+import heapq
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# WORKBOOK LOADING
+# =========================
+def spawn_pool(max_workers):
+    """Process pool for CPU-heavy work off the script thread.
+
+    Uses spawn rather than fork: the Streamlit server process is multi-threaded.
+    """
+    return ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def _parse_sheet(file_path, sheet_name):
+    return pd.read_excel(file_path, sheet_name=sheet_name)
+
+class WorkbookLoader:
+    """Parses the sheets of an Excel workbook on demand, several at a time in worker processes.
+
+    Only the sheet names are read up front. get() parses whichever of the requested
+    sheets have not been loaded yet (concurrently when there is more than one) and
+    keeps them, so the rest of the workbook is filled in lazily as it is asked for.
+    Each sheet is parsed once: callers asking for a sheet that is already being parsed
+    wait for that parse, and callers asking for loaded sheets never wait. The worker
+    pool is started on the first batch and reused. Returned frames are shared; treat
+    them as read-only.
+    """
+
+    def __init__(self, file_path, max_workers=None):
+        self.file_path = file_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._sheets = {}  # sheet name -> Future of its DataFrame
+        self._pool = None
+        self._lock = threading.Lock()
+        self._read_sheet_names()
+
+    def _read_sheet_names(self):
+        self._mtime = os.path.getmtime(self.file_path)
+        with pd.ExcelFile(self.file_path) as workbook:
+            self.sheet_names = list(workbook.sheet_names)
+
+    def refresh(self):
+        """Forget parsed sheets if the file changed on disk since it was read; True if it did."""
+        with self._lock:
+            if os.path.getmtime(self.file_path) == self._mtime:
+                return False
+            self._sheets.clear()
+            self._read_sheet_names()
+            return True
+
+    def get(self, sheet_names):
+        """Return {sheet_name: DataFrame} for sheet_names, parsing any not loaded yet."""
+        inline = []
+        with self._lock:
+            missing = [name for name in sheet_names if name not in self._sheets]
+            if len(missing) > 1 and self.max_workers > 1:
+                if self._pool is None:
+                    self._pool = spawn_pool(self.max_workers)
+                for name in missing:
+                    self._sheets[name] = self._pool.submit(_parse_sheet, self.file_path, name)
+            else:
+                # A single sheet is parsed in this thread; the pool start-up would cost more
+                for name in missing:
+                    self._sheets[name] = Future()
+                    inline.append(name)
+            futures = {name: self._sheets[name] for name in sheet_names}
+
+        # Parse and wait outside the lock so other sessions are not held up
+        for name in inline:
+            try:
+                futures[name].set_result(_parse_sheet(self.file_path, name))
+            except Exception as exc:
+                futures[name].set_exception(exc)
+        try:
+            return {name: future.result() for name, future in futures.items()}
+        except Exception as exc:
+            with self._lock:
+                # Let a later call retry the failed sheets (and replace a dead pool)
+                for name, future in futures.items():
+                    if future.done() and future.exception() is not None and self._sheets.get(name) is future:
+                        del self._sheets[name]
+                if isinstance(exc, BrokenProcessPool):
+                    self._pool = None
+            raise
+
+# =========================
+# PLAYER KEYS
+# =========================
+# Wyscout abbreviates names ("J. Rodríguez"), so a player is identified by name plus
+# these columns. The set is fixed so keys line up across frames; a frame that lacks
+# one of them gets an empty part there.
+PLAYER_KEY_COLUMNS = ["Player", "Team", "Age", "League"]
+
+def _key_part(df, column):
+    if column not in df.columns:
+        return pd.Series("", index=df.index)
+    values = df[column]
+    # Whole-number floats (e.g. ages in a column with gaps) format like ints, so keys match across frames
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype("Int64")
+    return values.astype(str).where(values.notna(), "")
+
+def player_keys(df):
+    """Stable, unique composite key per row: "name | team | age | league".
+
+    Set it as the frame's index (df.index = player_keys(df)) to get an O(1) hash lookup
+    from key to row (df.loc[key], df.index.get_loc(key)). Keys are built from the same
+    columns in every frame, so frames with those columns can be joined on them. Rows
+    that still collide get a " #2", " #3", ... suffix in row order.
+    """
+    parts = [_key_part(df, c) for c in PLAYER_KEY_COLUMNS]
+    keys = parts[0].str.cat(parts[1:], sep=" | ")
+    repeat = keys.groupby(keys).cumcount()
+    keys = keys.where(repeat == 0, keys + " #" + (repeat + 1).astype(str))
+    return pd.Index(keys.to_numpy(), name="Player key")
+
+def player_labels(df):
+    """Display names for dropdowns: the plain name, with team and age added for duplicates.
+
+    Rows that are still identical after that take the " #n" suffix of their player key,
+    so call it after setting the index to player_keys(df).
+    """
+    names = df["Player"].astype(str)
+    labels = names.copy()
+    duplicated = names.duplicated(keep=False)
+    if not duplicated.any():
+        return labels
+    details = pd.concat([_key_part(df, c) for c in ("Team", "Age")], axis=1)
+    detail = details.apply(lambda row: ", ".join(part for part in row if part), axis=1)
+    with_detail = names + (" (" + detail + ")").where(detail != "", "")
+    labels[duplicated] = with_detail[duplicated]
+    if df.index.name == "Player key":
+        suffix = pd.Series(df.index, index=df.index).str.extract(r"( #\d+)$", expand=False).fillna("")
+        labels += suffix.where(labels.duplicated(keep=False), "")
+    return labels
+
+# =========================
+# TEAM / LEAGUE ROLLUPS
+# =========================
+ROLLUP_DIMENSIONS = ["Team", "League", "Main Position"]
+
+def _rollup(df, by, roles, top_k):
+    """Mergeable aggregates of df grouped by column by.
+
+    Columns are a (role, stat) MultiIndex: "sum", "n" (rated players), "max" and "top"
+    (the top_k (rating, player) pairs), plus ("Players", "") for the group size.
+    """
+    names = df["Player label"] if "Player label" in df.columns else df["Player"]
+    grouped = df.groupby(by)
+    table = {("Players", ""): grouped.size()}
+    for role in roles:
+        ratings = df[role]
+        by_role = ratings.groupby(df[by])
+        table[(role, "sum")] = by_role.sum()
+        table[(role, "n")] = by_role.count()
+        table[(role, "max")] = by_role.max()
+        best = ratings.dropna().sort_values(ascending=False)
+        best = best.groupby(df.loc[best.index, by], sort=False).head(top_k)
+        pairs = pd.Series(list(zip(best.to_numpy(), names.loc[best.index].astype(str))), index=df.loc[best.index, by].to_numpy())
+        table[(role, "top")] = pairs.groupby(level=0).agg(list)
+    table = pd.DataFrame(table)
+    table.columns = pd.MultiIndex.from_tuples(table.columns)
+    table[[(role, "top") for role in roles]] = table[[(role, "top") for role in roles]].map(
+        lambda v: v if isinstance(v, list) else [])
+    return table
+
+class RollupStore:
+    """Team, league and position rollups of role ratings, materialized per band.
+
+    update() is called whenever a band frame is (re)loaded; it rebuilds that band's
+    rollups only if the band's contents changed. Queries merge the precomputed
+    per-band tables, so serving them never touches the player rows.
+    """
+
+    def __init__(self, roles, top_k=3):
+        self.roles = list(roles)
+        self.top_k = top_k
+        self._tables = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def update(self, band, df):
+        """(Re)build band's rollups if df differs from what they were built from; True if rebuilt."""
+        fingerprint = int(pd.util.hash_pandas_object(df, index=False).sum())
+        with self._lock:
+            if self._fingerprints.get(band) == fingerprint:
+                return False
+        roles = [role for role in self.roles if role in df.columns]
+        tables = {by: _rollup(df, by, roles, self.top_k) for by in ROLLUP_DIMENSIONS if by in df.columns}
+        with self._lock:
+            self._tables[band] = tables
+            self._fingerprints[band] = fingerprint
+        return True
+
+    @property
+    def bands(self):
+        return list(self._tables)
+
+    def summary(self, by, role, bands):
+        """Players, average, best and top-k ratings for role per value of by, over bands."""
+        with self._lock:
+            tables = [self._tables[band][by] for band in bands if by in self._tables.get(band, {})]
+        tables = [table for table in tables if role in table.columns.get_level_values(0)]
+        if not tables:
+            return pd.DataFrame(columns=["Players", "Average", "Best", f"Top {self.top_k}"])
+        stacked = pd.concat([table[["Players", role]] for table in tables])
+        top_k = self.top_k
+        top = stacked[(role, "top")].groupby(level=0).apply(
+            lambda lists: heapq.nlargest(top_k, (pair for pairs in lists for pair in pairs)))
+        summary = pd.DataFrame({
+            "Players": stacked[("Players", "")].groupby(level=0).sum(),
+            "Average": (stacked[(role, "sum")].groupby(level=0).sum()
+                        / stacked[(role, "n")].groupby(level=0).sum()).round(1),
+            "Best": stacked[(role, "max")].groupby(level=0).max(),
+            f"Top {top_k}": top.map(lambda pairs: ", ".join(f"{name} ({rating:.1f})" for rating, name in pairs)),
+        })
+        summary.index.name = by
+        return summary.sort_values("Average", ascending=False)
+
+    def band_counts(self, by, bands):
+        """Number of players per value of by in each band (one column per band)."""
+        with self._lock:
+            counts = {band: self._tables[band][by][("Players", "")] for band in bands if by in self._tables.get(band, {})}
+        if not counts:
+            return pd.DataFrame()
+        counts = pd.DataFrame(counts).fillna(0).astype(int)
+        counts.index.name = by
+        return counts
+
+# =========================
+# MINUTES-THRESHOLD PERCENTILES
+# =========================
+class _WaveletMatrix:
+    """Counts codes below a bound in any prefix of a sequence of small ints in O(log sigma)."""
+
+    def __init__(self, codes, sigma):
+        self.levels = max(1, int(sigma).bit_length())
+        self.zero_ranks = []
+        self.n_zeros = []
+        cur = np.asarray(codes, dtype=np.int64)
+        for level in range(self.levels):
+            bits = (cur >> (self.levels - 1 - level)) & 1
+            is_zero = bits == 0
+            # zero_ranks[level][i] = number of zero bits in cur[:i]
+            self.zero_ranks.append(np.concatenate(([0], np.cumsum(is_zero))))
+            self.n_zeros.append(int(is_zero.sum()))
+            cur = np.concatenate((cur[is_zero], cur[~is_zero]))
+
+    def count_less(self, k, bound):
+        """Number of codes < bound among the first k."""
+        count, start, end = 0, 0, k
+        for level in range(self.levels):
+            zeros = self.zero_ranks[level]
+            zs, ze = int(zeros[start]), int(zeros[end])
+            if (bound >> (self.levels - 1 - level)) & 1:
+                count += ze - zs
+                start = self.n_zeros[level] + start - zs
+                end = self.n_zeros[level] + end - ze
+            else:
+                start, end = zs, ze
+        return count
+
+class MinutesRankIndex:
+    """Percentile ranks against "peers with at least t minutes" for any threshold t.
+
+    Players are kept in descending minutes order, so the peers for a threshold are
+    a prefix of that order. Each metric gets a wavelet matrix over its value ranks,
+    which counts the peers below a score inside any prefix without refiltering or
+    resorting the pool. Percentiles match scipy.stats.percentileofscore (kind='rank')
+    on the filtered pool; NaN metric values are left out of the pool.
+    """
+
+    def __init__(self, minutes, metrics):
+        minutes = pd.to_numeric(pd.Series(minutes), errors="coerce").fillna(0).to_numpy(dtype=float)
+        order = np.argsort(-minutes, kind="stable")
+        self._neg_minutes = -minutes[order]
+        self._values = {}
+        self._matrices = {}
+        for metric in metrics.columns:
+            values = metrics[metric].to_numpy(dtype=float)[order]
+            valid = ~np.isnan(values)
+            uniques = np.unique(values[valid])
+            # NaNs get the largest code so they never count as "below" a score
+            codes = np.full(len(values), len(uniques), dtype=np.int64)
+            codes[valid] = np.searchsorted(uniques, values[valid])
+            self._values[metric] = uniques
+            self._matrices[metric] = _WaveletMatrix(codes, len(uniques))
+
+    def n_peers(self, min_minutes):
+        """Number of players with at least min_minutes minutes."""
+        return int(np.searchsorted(self._neg_minutes, -min_minutes, side="right"))
+
+    def percentile(self, metric, score, min_minutes):
+        """Percentile of score among players with at least min_minutes (NaN if undefined)."""
+        if np.isnan(score):
+            return np.nan
+        k = self.n_peers(min_minutes)
+        uniques, matrix = self._values[metric], self._matrices[metric]
+        n = matrix.count_less(k, len(uniques))
+        if n == 0:
+            return np.nan
+        left = matrix.count_less(k, int(np.searchsorted(uniques, score, side="left")))
+        right = matrix.count_less(k, int(np.searchsorted(uniques, score, side="right")))
+        return (left + right + (1 if right > left else 0)) * 50.0 / n
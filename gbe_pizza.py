@@ -0,0 +1,288 @@
+import io
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from functools import lru_cache
+
+import matplotlib.image as mpimg
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+from mplsoccer import PyPizza, add_image
+
+# Pizza figures are built with the object-oriented matplotlib API (no pyplot state),
+# so they are safe to build outside the script thread (e.g. in the prefetch threads).
+
+BACKGROUND_COLOR = "#0A2D57"
+ATTACKING_COLOR = "#44aa66"
+POSSESSION_COLOR = "#f4c430"
+DEFENDING_COLOR = "#367588"
+LOGO_PATH = "Capture.png"
+
+# Extra space under the pizza on report pages for the role ratings block (inches)
+REPORT_FOOTER_HEIGHT = 3.5
+
+# =========================
+# COLOURS
+# =========================
+def group_colors(group, n_params):
+    """Slice and value-text colours for a position group's pizza."""
+    if group == "Forwards":
+        slice_colors = [ATTACKING_COLOR] * 6 + [POSSESSION_COLOR] * 6 + [DEFENDING_COLOR] * 4
+        text_colors = ["#000000"] * 16
+    elif group == "CMs":
+        slice_colors = [ATTACKING_COLOR] * 3 + [POSSESSION_COLOR] * 8 + [DEFENDING_COLOR] * 5
+        text_colors = ["#000000"] * 16
+    elif group == "FBs/WBs":
+        slice_colors = [ATTACKING_COLOR] * 7 + [POSSESSION_COLOR] * 5 + [DEFENDING_COLOR] * 5
+        text_colors = ["#000000"] * 17
+    elif group == "CBs":
+        slice_colors = [ATTACKING_COLOR] * 3 + [POSSESSION_COLOR] * 8 + [DEFENDING_COLOR] * 6
+        text_colors = ["#000000"] * 17
+    elif group == "Wingers/AMs":
+        slice_colors = [ATTACKING_COLOR] * 6 + [POSSESSION_COLOR] * 6 + [DEFENDING_COLOR] * 4
+        text_colors = ["#000000"] * 16
+    else:
+        slice_colors = [ATTACKING_COLOR] * n_params
+        text_colors = ["#000000"] * n_params
+    return slice_colors, text_colors
+
+@lru_cache(maxsize=1)
+def load_logo():
+    try:
+        return mpimg.imread(LOGO_PATH)
+    except (OSError, SyntaxError, ValueError):
+        return None
+
+# =========================
+# FIGURES
+# =========================
+def make_pizza_figure(spec, footer=0.0):
+    """Build the pizza figure described by spec.
+
+    spec is a plain dict with keys "player", "subtitle", "group", "params" (display
+    names), "values" (percentiles) and "info" (lines for the top-left info block).
+    footer adds that many inches of empty space below the 10x10 pizza layout.
+    """
+    height = 10 + footer
+    # Map a y position of the 10x10 layout onto the (possibly taller) figure
+    def y(frac):
+        return (frac * 10 + footer) / height
+
+    fig = Figure(figsize=(10, height), facecolor=BACKGROUND_COLOR)
+    ax = fig.add_axes((0.125, y(0.11), 0.775, 7.7 / height), projection="polar")
+    ax.set_facecolor(BACKGROUND_COLOR)
+
+    slice_colors, text_colors = group_colors(spec["group"], len(spec["params"]))
+    baker = PyPizza(
+        params=spec["params"],
+        background_color=BACKGROUND_COLOR,
+        straight_line_color="#FFFFFF",
+        straight_line_lw=1,
+        last_circle_lw=0,
+        other_circle_lw=0,
+        inner_circle_size=5
+    )
+    baker.make_pizza(
+        spec["values"],
+        ax=ax,
+        color_blank_space="same",
+        slice_colors=slice_colors,
+        value_colors=text_colors,
+        value_bck_colors=slice_colors,
+        blank_alpha=0.4,
+        kwargs_slices=dict(edgecolor="#FFFFFF", zorder=2, linewidth=1),
+        kwargs_params=dict(color="#FFFFFF", fontsize=11),
+        kwargs_values=dict(color="#FFFFFF", fontsize=12,
+                           bbox=dict(edgecolor="#FFFFFF", facecolor=BACKGROUND_COLOR, boxstyle="round,pad=0.2", lw=1))
+    )
+
+    # Titles
+    fig.text(0.515, y(0.9975), spec["player"], size=18, fontweight='bold', ha="center", color="#FFFFFF")
+    fig.text(0.515, y(0.975), spec["subtitle"], size=14, ha="center", color="#FFFFFF")
+
+    # Top-left info
+    for i, txt in enumerate(spec["info"]):
+        fig.text(0.02, y(0.92 - i*0.025), txt, ha="left", color="#FFFFFF", fontsize=12)
+
+    # Legend
+    fig.text(0.35, y(0.945), "Attacking     Possession     Defending", size=14, color="#FFFFFF")
+    fig.patches.extend([
+        Rectangle((0.32, y(0.9425)), 0.025, 0.21 / height, fill=True, color=ATTACKING_COLOR, transform=fig.transFigure, figure=fig),
+        Rectangle((0.445, y(0.9425)), 0.025, 0.21 / height, fill=True, color=POSSESSION_COLOR, transform=fig.transFigure, figure=fig),
+        Rectangle((0.582, y(0.9425)), 0.025, 0.21 / height, fill=True, color=DEFENDING_COLOR, transform=fig.transFigure, figure=fig),
+    ])
+
+    # Logo
+    logo = load_logo()
+    if logo is not None:
+        add_image(logo, fig, left=0.82, bottom=y(0.02), width=0.15, height=0.8 / height)
+
+    return fig
+
+def make_report_page(spec):
+    """Pizza figure with the player's role ratings listed underneath.
+
+    spec is as for make_pizza_figure plus "roles", a list of (role, rating) pairs.
+    """
+    fig = make_pizza_figure(spec, footer=REPORT_FOOTER_HEIGHT)
+    height = fig.get_figheight()
+
+    fig.text(0.05, (REPORT_FOOTER_HEIGHT - 0.2) / height, "Role ratings", size=14, fontweight='bold', color="#FFFFFF", va="top")
+    # Unrated roles (NaN) are left out rather than breaking the sort
+    roles = sorted([(role, rating) for role, rating in spec["roles"] if not math.isnan(rating)],
+                   key=lambda item: item[1], reverse=True)
+    rows_per_column = -(-len(roles) // 3) if roles else 1
+    for i, (role, rating) in enumerate(roles):
+        col, row = divmod(i, rows_per_column)
+        fig.text(0.05 + col * 0.31, (REPORT_FOOTER_HEIGHT - 0.6 - row * 0.3) / height,
+                 f"{role}: {rating:.1f}", size=11, color="#FFFFFF", va="top")
+    return fig
+
+# =========================
+# PNG RENDERING
+# =========================
+def figure_png(fig, dpi):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight", facecolor=fig.get_facecolor())
+    return buf.getvalue()
+
+def render_pizza_png(spec, dpi=200):
+    """Render the dashboard pizza to PNG bytes (same output settings as st.pyplot)."""
+    return figure_png(make_pizza_figure(spec), dpi)
+
+# =========================
+# BACKGROUND PREFETCH
+# =========================
+class PizzaPrefetcher:
+    """Renders the pizzas a session is likely to ask for next in background threads.
+
+    One instance is shared by all sessions. Finished PNGs go into an LRU cache capped
+    at max_bytes; at most max_workers renders run at once. prefetch() replaces a
+    session's queued work, cancelling renders that are no longer wanted or belong to
+    a previous selection context (band, filters, ...). Only the max_sessions most
+    recently active sessions are tracked; older ones have their queued work cancelled.
+    """
+
+    def __init__(self, max_workers=2, max_bytes=64 * 2**20, max_sessions=256):
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="pizza-prefetch")
+        # Re-entrant: a future's done-callback can run inline while the lock is held
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()  # key -> PNG bytes, least recently used first
+        self._cache_bytes = 0
+        self._in_flight = {}  # key -> Future
+        # Bumped by clear(); renders started before then are not cached
+        self._generation = 0
+        # session id -> (context, {key: unfinished Future}), least recently active first
+        self._sessions = OrderedDict()
+
+    def get(self, key):
+        """Cached PNG for key, or None.
+
+        If the key is already rendering in the background this waits for it; if it is
+        only queued, the queued render is cancelled and None returned so the caller can
+        render it straight away rather than wait behind other prefetches.
+        """
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            future = self._in_flight.get(key)
+            if future is None or future.cancel():
+                return None
+        try:
+            future.result()
+        except CancelledError:
+            return None
+        with self._lock:
+            return self._cache.get(key)
+
+    def render(self, key, make_spec):
+        """PNG for key, rendering it now (and caching it) if it was not prefetched."""
+        png = self.get(key)
+        if png is None:
+            generation = self._generation
+            png = render_pizza_png(make_spec())
+            self._store(key, png, generation)
+        return png
+
+    def prefetch(self, session_id, context, jobs):
+        """Queue background renders for a session; jobs maps cache keys to spec builders.
+
+        Work queued earlier by the same session is cancelled if context changed or its
+        key is not in jobs. Spec builders run in the worker thread, so they should only
+        read shared, already-loaded data.
+        """
+        with self._lock:
+            old_context, pending = self._sessions.pop(session_id, (None, {}))
+            keep = {}
+            for key, future in list(pending.items()):
+                if old_context == context and key in jobs:
+                    keep[key] = future
+                else:
+                    future.cancel()
+            self._sessions[session_id] = (context, keep)
+            for key, make_spec in jobs.items():
+                if key in keep or key in self._cache:
+                    continue
+                future = self._in_flight.get(key)
+                if future is None or future.done():
+                    future = self._pool.submit(self._run, session_id, context, key, make_spec, self._generation)
+                    self._in_flight[key] = future
+                    future.add_done_callback(lambda f, key=key: self._forget_in_flight(key, f))
+                keep[key] = future
+                future.add_done_callback(lambda f, key=key: self._forget_pending(session_id, key, f))
+            if not keep:
+                self._sessions.pop(session_id, None)
+            while len(self._sessions) > self.max_sessions:
+                _, (_, evicted) = self._sessions.popitem(last=False)
+                for future in list(evicted.values()):
+                    future.cancel()
+
+    def clear(self):
+        """Drop every cached render and cancel queued work (e.g. after the data changed).
+
+        Renders already running finish, but their PNGs are discarded rather than cached.
+        """
+        with self._lock:
+            self._generation += 1
+            for future in list(self._in_flight.values()):
+                future.cancel()
+            self._in_flight.clear()
+            self._sessions.clear()
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def _run(self, session_id, context, key, make_spec, generation):
+        # The PNG only goes into the cache, so finished futures hold no bytes outside its budget
+        with self._lock:
+            if self._sessions.get(session_id, (None, {}))[0] != context:
+                return  # selection moved on after this was queued
+        self._store(key, render_pizza_png(make_spec()), generation)
+
+    def _store(self, key, png, generation):
+        with self._lock:
+            if generation != self._generation:
+                return  # rendered from data that clear() has since dropped
+            if key in self._cache:
+                self._cache_bytes -= len(self._cache.pop(key))
+            self._cache[key] = png
+            self._cache_bytes += len(png)
+            while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+
+    def _forget_in_flight(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _forget_pending(self, session_id, key, future):
+        with self._lock:
+            context, pending = self._sessions.get(session_id, (None, {}))
+            if pending.get(key) is future:
+                del pending[key]
+                if not pending:
+                    del self._sessions[session_id]
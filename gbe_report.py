@@ -0,0 +1,25 @@
+from matplotlib.backends.backend_pdf import PdfPages
+
+from gbe_pizza import make_report_page
+
+# =========================
+# STREAMING PDF REPORTS
+# =========================
+def write_pdf_report(specs, out, on_page=None):
+    """Draw one vector page per player spec and stream them into one PDF.
+
+    specs may be any iterable of report-page specs (see gbe_pizza.make_report_page) and
+    is consumed lazily. Each page is drawn straight into the PDF and dropped once written,
+    so only one page figure is in memory at a time however long the shortlist is; pages
+    keep their text selectable. out is a path or a binary file object. on_page, if given,
+    is called with the number of pages written so far. Returns the page count.
+    """
+    written = 0
+    with PdfPages(out) as pdf:
+        for spec in specs:
+            fig = make_report_page(spec)
+            pdf.savefig(fig, bbox_inches="tight", facecolor=fig.get_facecolor())
+            written += 1
+            if on_page is not None:
+                on_page(written)
+    return written
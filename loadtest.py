@@ -0,0 +1,184 @@
+"""Concurrent-session load test for the gbeTest.py dashboard.
+
+Simulates N scouts using the app at once, each in its own Streamlit session, all in
+this one process so they share st.cache_* state, the prefetcher and the worker pools.
+Sessions are driven with Streamlit's headless AppTest and run a scripted mix of
+interactions; every interaction is a full script rerun. AppTest swaps the global
+Runtime instance and config on every run, so reruns from different sessions would
+corrupt each other if they overlapped; they take turns instead. Sessions still
+interleave, and background work (prefetch threads, worker pools) keeps running
+between reruns, but the latencies are per-rerun service times, not the end-to-end
+waits of a server running reruns side by side.
+
+    python loadtest.py --sessions 30 --iterations 5
+
+Run it from the directory holding the data files. The interactions use gbeTest.py's
+widget keys, so other apps need their own script. Reports per-interaction latency
+percentiles, overall throughput, peak RSS and any sessions that failed.
+"""
+import argparse
+import glob
+import random
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+APP = "gbeTest.py"
+
+# AppTest.run() replaces process-wide Streamlit state, so only one runs at a time
+_run_lock = threading.Lock()
+
+# =========================
+# INTERACTIONS
+# =========================
+# Each takes (app, rng) and sets a widget; the rerun that follows is what gets timed.
+def switch_band(at, rng):
+    at.selectbox(key="tab2_band").select(rng.choice(at.selectbox(key="tab2_band").options))
+    # The player selectbox holds a key from the old band; clear it so the app picks the
+    # new band's first player, as a browser does, instead of matching the old label
+    at.selectbox(key="tab2_player").set_value(None)
+
+def search(at, rng):
+    at.text_input(key="tab1_search").input(rng.choice(["", "a", "an", "son", "ez"]))
+
+def change_role(at, rng):
+    at.selectbox(key="tab1_role").select(rng.choice(at.selectbox(key="tab1_role").options))
+
+def pick_player(at, rng):
+    player = at.selectbox(key="tab2_player")
+    if player.options:
+        player.select_index(rng.randrange(len(player.options)))
+
+INTERACTIONS = {
+    "switch band": switch_band,
+    "search": search,
+    "change role": change_role,
+    "pick player": pick_player,
+}
+
+# =========================
+# SESSIONS
+# =========================
+def timed_run(at):
+    """Rerun the session's script and return how long the rerun itself took."""
+    with _run_lock:
+        start = time.perf_counter()
+        at.run()
+        return time.perf_counter() - start
+
+def run_session(session_id, iterations, think_time, timeout, seed, timings, lock):
+    """Open one session and run the interaction script, recording (name, seconds).
+
+    Timings collected before a failure are kept; the failure is raised afterwards.
+    """
+    rng = random.Random(seed + session_id)
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    records = []
+
+    try:
+        records.append(("initial load", timed_run(at)))
+        if at.exception:
+            raise RuntimeError(f"session {session_id}, initial load: {at.exception[0].message}")
+
+        for _ in range(iterations):
+            for name, interact in INTERACTIONS.items():
+                if think_time:
+                    time.sleep(rng.uniform(0, think_time))
+                try:
+                    interact(at, rng)
+                except Exception as exc:
+                    raise RuntimeError(f"session {session_id}, {name}: {type(exc).__name__}: {exc}") from exc
+                records.append((name, timed_run(at)))
+                if at.exception:
+                    raise RuntimeError(f"session {session_id}, {name}: {at.exception[0].message}")
+    finally:
+        with lock:
+            for name, seconds in records:
+                timings[name].append(seconds)
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def live_workers_peak_mb():
+    """Summed peak RSS of this process's running children (Linux only, else 0).
+
+    The sheet-parsing pool is long-lived, so its workers are still running at the end
+    and RUSAGE_CHILDREN (which only counts children that have exited) misses them.
+    """
+    total_kb = 0
+    for children in glob.glob("/proc/self/task/*/children"):
+        with open(children) as f:
+            pids = f.read().split()
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            total_kb += int(line.split()[1])
+            except OSError:
+                pass  # exited since it was listed
+    return total_kb / 1024
+
+# =========================
+# REPORT
+# =========================
+def print_report(timings, wall_time, n_sessions, errors):
+    print(f"\n{n_sessions} sessions, {wall_time:.1f} s wall time")
+    print(f"{'interaction':<14}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in ["initial load"] + list(INTERACTIONS):
+        samples = np.array(timings.get(name, [])) * 1000
+        if not len(samples):
+            continue
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+        print(f"{name:<14}{len(samples):>7}{p50:>10.0f}{p90:>10.0f}{p99:>10.0f}{samples.max():>10.0f}")
+    n_interactions = sum(len(v) for k, v in timings.items() if k != "initial load")
+    print(f"\nthroughput: {n_interactions / wall_time:.2f} interactions/s")
+    print("note: reruns are serialized (AppTest swaps global Streamlit state), so latencies are\n"
+          "per-rerun service times under shared load, not end-to-end waits with overlapping reruns")
+    # Spawned sheet-parsing and report workers are separate processes, so list them too.
+    # RUSAGE_CHILDREN is the largest worker that has exited, not a sum.
+    print(f"peak RSS: {peak_rss_mb():.0f} MB this process, "
+          f"{live_workers_peak_mb():.0f} MB running workers (sum), "
+          f"{peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB largest exited worker")
+    if errors:
+        print(f"\n{len(errors)} of {n_sessions} sessions failed:")
+        for error in errors:
+            print(f"  {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=30, help="concurrent sessions")
+    parser.add_argument("--iterations", type=int, default=3, help="passes through the interaction script per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max random pause before each interaction (s)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="per-rerun timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    timings = defaultdict(list)
+    errors = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.sessions) as pool:
+        futures = [
+            pool.submit(run_session, i, args.iterations, args.think_time, args.timeout, args.seed, timings, lock)
+            for i in range(args.sessions)
+        ]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as exc:
+                errors.append(f"{type(exc).__name__}: {exc}")
+    print_report(timings, time.perf_counter() - start, args.sessions, errors)
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()